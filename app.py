@@ -1,10 +1,11 @@
 import streamlit as st
 import pandas as pd
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import numpy as np
+from psycopg.rows import dict_row
+from psycopg.errors import InvalidColumnReference
+from psycopg_pool import ConnectionPool
+from contextlib import contextmanager
 import bcrypt
-import os
-from dotenv import load_dotenv
 
 # -------------------------------
 # Streamlit Config
@@ -15,109 +16,171 @@ st.set_page_config(
     layout="wide",
 )
 
+# -------------------------------
+# Form Options
+# -------------------------------
+RESULTS = ("Win", "Loss")
+MAPS = ("Bind", "Split", "Ascent", "Haven", "Breeze", "Fracture", "Icebox", "Pearl", "Sunset", "Abyss")
+AGENTS = ("Astra", "Breach", "Brimstone", "Chamber", "Clove", "Cypher", "Deadlock", "Harbor", "Iso", "Jett", "Kay/O", "Killjoy", "Neon", "Omen", "Phoenix", "Raze", "Reyna", "Sage", "Skye", "Sova", "Viper", "Vyse", "Yoru")
+RANKS = ("Unranked", "Iron 1", "Iron 2", "Iron 3", "Bronze 1", "Bronze 2", "Bronze 3", "Silver 1", "Silver 2", "Silver 3", "Gold 1", "Gold 2", "Gold 3", "Platinum 1", "Platinum 2", "Platinum 3", "Diamond 1", "Diamond 2", "Diamond 3", "Ascendant 1", "Ascendant 2", "Ascendant 3", "Immortal 1", "Immortal 2", "Immortal 3", "Radiant")
+
 # -------------------------------
 # Env + DB
 # -------------------------------
-load_dotenv()
-DATABASE_URL = os.getenv("DATABASE_URL")
+BCRYPT_ROUNDS = 10
+MATCH_FETCH_LIMIT = 500
+
+@st.cache_resource
+def get_pool():
+    # psycopg prepares statements server-side once a query repeats on a connection,
+    # so pooled connections keep their plans warm across reruns. The DSN comes from
+    # .streamlit/secrets.toml, which Streamlit parses once per process.
+    return ConnectionPool(
+        st.secrets["DATABASE_URL"],
+        min_size=1,
+        max_size=10,
+        kwargs={"sslmode": "require", "row_factory": dict_row},
+        open=True,
+    )
 
-def get_connection():
-    return psycopg2.connect(DATABASE_URL, sslmode="require", cursor_factory=RealDictCursor)
+@contextmanager
+def db_cursor(autocommit=False):
+    """Check a pooled connection out, yield a cursor, commit and hand it back.
+    autocommit skips BEGIN/COMMIT, for helpers that issue a single write."""
+    with get_pool().connection() as conn:
+        conn.autocommit = autocommit
+        with conn.cursor() as cur:
+            yield cur
 
 # -------------------------------
 # AUTH HELPERS
 # -------------------------------
 def get_user(username):
     query = "SELECT * FROM users WHERE username = %s"
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(query, (username,))
-            return cur.fetchone()
+    with db_cursor() as cur:
+        cur.execute(query, (username,))
+        return cur.fetchone()
+
+@st.cache_resource
+def get_dummy_hash():
+    """Hash checked when the username is unknown, so login timing doesn't reveal which users exist"""
+    return bcrypt.hashpw(b"x", bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+# Built at load so the first unknown-user login isn't slower than the rest
+get_dummy_hash()
 
 def verify_password(password, password_hash):
     return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
 
 def register_user(username, password):
-    """Register new player user"""
-    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    """Register new player user, returning the new row or None if it failed"""
+    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+    query = """
+        INSERT INTO users (username, password_hash, role) VALUES (%s, %s, 'player')
+        ON CONFLICT (username) DO NOTHING
+        RETURNING *
+    """
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    "INSERT INTO users (username, password_hash, role) VALUES (%s, %s, 'player')",
-                    (username, hashed),
-                )
-                conn.commit()
-                return True
+        with db_cursor(autocommit=True) as cur:
+            cur.execute(query, (username, hashed))
+            new_user = cur.fetchone()
+    except InvalidColumnReference:
+        # ON CONFLICT (username) needs the unique index created by migrate.py
+        st.error("Registration is unavailable: the database is missing the unique username index. Run `python migrate.py`.")
+        return None
     except Exception as e:
         st.error(f"Error registering user: {e}")
-        return False
+        return None
+    if new_user is None:
+        st.error("Username already exists.")
+    return new_user
 
 def login(username, password):
     user = get_user(username)
-    if user and verify_password(password, user["password_hash"]):
-        return user
-    return None
+    stored_hash = user["password_hash"] if user else get_dummy_hash()
+    password_ok = verify_password(password, stored_hash)
+    return user if user and password_ok else None
 
 # -------------------------------
 # MATCH HELPERS
 # -------------------------------
 def calculate_kd_ratio(kills, deaths):
-    return kills if deaths == 0 else kills / deaths
+    """Vectorized K/D: kills / deaths, or kills when deaths is 0"""
+    kills = np.asarray(kills, dtype=float)
+    deaths = np.asarray(deaths, dtype=float)
+    return np.where(deaths == 0, kills, kills / np.where(deaths == 0, 1, deaths))
 
-def add_match(user_id, player_name, win_loss, map_name, agent, current_rank, acs, econ_rating, kills, deaths, assists):
+def add_matches_bulk(rows):
+    """Insert many match rows in one pipelined batch. Each row is a tuple in add_match argument order"""
     query = """
         INSERT INTO matches (user_id, player_name, win_loss, map_name, agent, current_rank, acs, econ_rating, kills, deaths, assists)
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
     """
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(query, (user_id, player_name, win_loss, map_name, agent, current_rank, acs, econ_rating, kills, deaths, assists))
-            conn.commit()
+    with db_cursor() as cur:
+        cur.executemany(query, rows)
+    clear_match_cache()
+
+def add_match(user_id, player_name, win_loss, map_name, agent, current_rank, acs, econ_rating, kills, deaths, assists):
+    add_matches_bulk([(user_id, player_name, win_loss, map_name, agent, current_rank, acs, econ_rating, kills, deaths, assists)])
 
 def delete_match(record_id, user):
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            if user["role"] == "player":
-                cur.execute("DELETE FROM matches WHERE id = %s AND user_id = %s", (record_id, user["id"]))
-            else:
-                cur.execute("DELETE FROM matches WHERE id = %s", (record_id,))
-            conn.commit()
+    with db_cursor(autocommit=True) as cur:
+        if user["role"] == "player":
+            cur.execute("DELETE FROM matches WHERE id = %s AND user_id = %s", (record_id, user["id"]))
+        else:
+            cur.execute("DELETE FROM matches WHERE id = %s", (record_id,))
+    clear_match_cache()
 
+@st.cache_data(ttl=30, show_spinner=False)
 def fetch_matches_by_user(username):
-    query = "SELECT * FROM matches WHERE player_name = %s ORDER BY id DESC"
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(query, (username,))
-            return cur.fetchall()
+    query = "SELECT * FROM matches WHERE player_name = %s ORDER BY id DESC LIMIT %s"
+    with db_cursor() as cur:
+        cur.execute(query, (username, MATCH_FETCH_LIMIT))
+        return cur.fetchall()
 
+@st.cache_data(ttl=30, show_spinner=False)
 def fetch_all_matches():
-    query = "SELECT * FROM matches ORDER BY id DESC"
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute(query)
-            return cur.fetchall()
-
-def aggregate_player_stats(data):
-    if not data:
-        return pd.DataFrame()
-    df = pd.DataFrame(data)
-    df["K/D Ratio"] = df.apply(lambda row: calculate_kd_ratio(row["kills"], row["deaths"]), axis=1)
-    aggregated_df = (
-        df.groupby("player_name")
-        .agg({
-            "acs": "mean",
-            "econ_rating": "mean",
-            "kills": "sum",
-            "deaths": "sum",
-            "assists": "sum",
-            "K/D Ratio": "mean",
-            "win_loss": "count"
-        })
-        .reset_index()
-        .rename(columns={"win_loss": "matches_played", "acs": "avg_acs", "econ_rating": "avg_econ_rating"})
-    )
-    return aggregated_df.round(2)
+    query = "SELECT * FROM matches ORDER BY id DESC LIMIT %s"
+    with db_cursor() as cur:
+        cur.execute(query, (MATCH_FETCH_LIMIT,))
+        return cur.fetchall()
+
+def fetch_visible_matches(user):
+    """Matches the user may see: all for admins, their own for players"""
+    return fetch_all_matches() if user["role"] == "admin" else fetch_matches_by_user(user["username"])
+
+def clear_match_cache():
+    fetch_all_matches.clear()
+    fetch_matches_by_user.clear()
+    fetch_leaderboard.clear()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_leaderboard():
+    """Per-player totals aggregated in Postgres, one row per player"""
+    query = """
+        SELECT
+            player_name,
+            AVG(acs)::float AS avg_acs,
+            AVG(econ_rating)::float AS avg_econ_rating,
+            SUM(kills) AS kills,
+            SUM(deaths) AS deaths,
+            SUM(assists) AS assists,
+            COALESCE(SUM(kills)::float / NULLIF(SUM(deaths), 0), SUM(kills)) AS "K/D Ratio",
+            COUNT(*) AS matches_played
+        FROM matches
+        GROUP BY player_name
+    """
+    with db_cursor() as cur:
+        cur.execute(query)
+        return cur.fetchall()
+
+def downcast_numeric(df):
+    """Shrink stat columns to the smallest dtype that fits, so less is serialized to the browser"""
+    for col in ("kills", "deaths", "assists", "acs"):
+        df[col] = pd.to_numeric(df[col], downcast="integer")
+    for col in ("econ_rating", "K/D Ratio"):
+        df[col] = pd.to_numeric(df[col], downcast="float")
+    return df
 
 def rank_players(aggregated_df):
     ranked_df = aggregated_df.sort_values(by="avg_acs", ascending=False).reset_index(drop=True)
@@ -139,7 +202,8 @@ if not st.session_state.user:
         password = st.text_input("Password", type="password", key="login_pass")
 
         if st.button("Login"):
-            user = login(username, password)
+            with st.spinner("Logging in..."):
+                user = login(username, password)
             if user:
                 st.session_state.user = user
                 st.success(f"Welcome {user['username']} ({user['role'].capitalize()})")
@@ -156,11 +220,8 @@ if not st.session_state.user:
         if st.button("Register"):
             if new_pass != confirm_pass:
                 st.error("Passwords do not match.")
-            elif get_user(new_user):
-                st.error("Username already exists.")
-            else:
-                if register_user(new_user, new_pass):
-                    st.success("✅ Registration successful! You can now log in.")
+            elif register_user(new_user, new_pass):
+                st.success("✅ Registration successful! You can now log in.")
     st.stop()
 
 # -------------------------------
@@ -191,10 +252,10 @@ with st.form("match_form"):
         key="player_name_input"
     )
 
-    win_loss = st.selectbox("Win/Loss", ["Win", "Loss"])
-    map_name = st.selectbox("Map", ["Bind", "Split", "Ascent", "Haven", "Breeze", "Fracture", "Icebox", "Pearl", "Sunset", "Abyss"])
-    agent = st.selectbox("Agent", ["Astra", "Breach", "Brimstone", "Chamber", "Clove", "Cypher", "Deadlock", "Harbor", "Iso", "Jett", "Kay/O", "Killjoy", "Neon", "Omen", "Phoenix", "Raze", "Reyna", "Sage", "Skye", "Sova", "Viper", "Vyse", "Yoru"])
-    current_rank = st.selectbox("Current Rank", ["Unranked", "Iron 1", "Iron 2", "Iron 3", "Bronze 1", "Bronze 2", "Bronze 3", "Silver 1", "Silver 2", "Silver 3", "Gold 1", "Gold 2", "Gold 3", "Platinum 1", "Platinum 2", "Platinum 3", "Diamond 1", "Diamond 2", "Diamond 3", "Ascendant 1", "Ascendant 2", "Ascendant 3", "Immortal 1", "Immortal 2", "Immortal 3", "Radiant"])
+    win_loss = st.selectbox("Win/Loss", RESULTS)
+    map_name = st.selectbox("Map", MAPS)
+    agent = st.selectbox("Agent", AGENTS)
+    current_rank = st.selectbox("Current Rank", RANKS)
     acs = st.number_input("Average Combat Score (ACS)", min_value=0)
     econ_rating = st.number_input("Econ Rating", min_value=0.0)
     kills = st.number_input("Kills", min_value=0)
@@ -218,42 +279,38 @@ with st.form("match_form"):
 # -------------------------------
 with st.form("delete_form"):
     st.subheader("Delete a Record")
-    match_data = fetch_matches_by_user(user["username"]) if user["role"] == "player" else fetch_all_matches()
+    match_data = fetch_visible_matches(user)
     if match_data:
-        df = pd.DataFrame(match_data)
-        # record_options = df.apply(lambda row: f"{row['id']} | {row['player_name']} | {row['map_name']} | {row['agent']} | {row['current_rank']} | {row['kills']}/{row['deaths']}", axis=1)
-        record_options = df.apply(lambda row: f"{row['player_name']} | {row['map_name']} | {row['agent']} | {row['current_rank']} | {row['kills']}/{row['deaths']}", axis=1)
-        record_to_delete = st.selectbox("Select Record to Delete", record_options)
+        record_labels = [
+            f"{r['id']} | {r['player_name']} | {r['map_name']} | {r['agent']} | {r['current_rank']} | {r['kills']}/{r['deaths']}"
+            for r in match_data
+        ]
+        record_ids = [r["id"] for r in match_data]
+        record_idx = st.selectbox("Select Record to Delete", range(len(record_labels)), format_func=lambda i: record_labels[i])
         if st.form_submit_button("Delete Record"):
-            record_id = int(record_to_delete.split(" | ")[0])
+            record_id = record_ids[record_idx]
             delete_match(record_id, user)
+            match_data = fetch_visible_matches(user)
             st.success("🗑️ Record deleted successfully!")
 
 # -------------------------------
 # DISPLAY SECTION
 # -------------------------------
-if user["role"] == "admin":
-    match_data = fetch_all_matches()
-else:
-    match_data = fetch_matches_by_user(user["username"])
-
-# Always fetch all for leaderboard
-all_match_data = fetch_all_matches()
-
 if match_data:
-    df = pd.DataFrame(match_data)
-    df["K/D Ratio"] = df.apply(lambda row: calculate_kd_ratio(row["kills"], row["deaths"]), axis=1)
+    df = pd.DataFrame(match_data).drop(columns=["user_id"]).set_index("id")
+    df["K/D Ratio"] = calculate_kd_ratio(df["kills"].to_numpy(), df["deaths"].to_numpy())
+    df = downcast_numeric(df)
 
     st.subheader("🎯 Your Match Records" if user["role"] == "player" else "🎯 All Match Records")
-    st.dataframe(df.drop(columns=["user_id", "id"]), width='stretch')
+    st.dataframe(df, width='stretch')
 else:
     st.info("No match data available. Please add match details.")
 
-if all_match_data:
-    aggregated_df = aggregate_player_stats(all_match_data)
-    if not aggregated_df.empty:
-        st.subheader("🏆 Leaderboard: Ranked Players by Avg ACS")
-        ranked_df = rank_players(aggregated_df)
-        st.dataframe(ranked_df, width='stretch')
+leaderboard_data = fetch_leaderboard()
+if leaderboard_data:
+    aggregated_df = pd.DataFrame(leaderboard_data).round(2)
+    st.subheader("🏆 Leaderboard: Ranked Players by Avg ACS")
+    ranked_df = rank_players(aggregated_df)
+    st.dataframe(ranked_df, width='stretch')
 else:
     st.info("No leaderboard data available.")
@@ -0,0 +1,49 @@
+import sys
+import psycopg
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# CONCURRENTLY builds without blocking writes, but can't run inside a transaction.
+# A failed concurrent build leaves an INVALID index that IF NOT EXISTS would skip,
+# so each index is checked and rebuilt if needed.
+INDEXES = (
+    ("idx_users_username", "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_users_username ON users(username)"),
+    ("idx_matches_player_name", "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_matches_player_name ON matches(player_name)"),
+    ("idx_matches_user_id", "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_matches_user_id ON matches(user_id)"),
+)
+
+VALIDITY_QUERY = """
+    SELECT i.indisvalid
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE c.relname = %s AND pg_catalog.pg_table_is_visible(c.oid)
+"""
+
+def get_connection():
+    return psycopg.connect(DATABASE_URL, sslmode="require", autocommit=True)
+
+def index_valid(cur, name):
+    """True if the index exists and is valid, False if invalid, None if missing"""
+    cur.execute(VALIDITY_QUERY, (name,))
+    row = cur.fetchone()
+    return None if row is None else row[0]
+
+with get_connection() as conn:
+    with conn.cursor() as cur:
+        cur.execute("SELECT username FROM users GROUP BY username HAVING COUNT(*) > 1")
+        duplicates = [row[0] for row in cur.fetchall()]
+        if duplicates:
+            print(f"❌ Duplicate usernames must be resolved first: {', '.join(duplicates)}")
+            sys.exit(1)
+        for name, statement in INDEXES:
+            if index_valid(cur, name) is False:
+                print(f"⚠️ Rebuilding invalid index '{name}'")
+                cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            cur.execute(statement)
+            if not index_valid(cur, name):
+                print(f"❌ Index '{name}' was not built successfully, resolve the cause and rerun")
+                sys.exit(1)
+        print("✅ Migrations applied successfully!")